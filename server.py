@@ -1,16 +1,24 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header
 from dotenv import load_dotenv
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import os
+import asyncio
 import logging
 from pathlib import Path
+from functools import lru_cache
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union
 import uuid
+import time
+import hashlib
 from datetime import datetime, timezone
 import bcrypt
 import jwt
+from cachetools import TLRUCache, TTLCache
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 
 ROOT_DIR = Path(__file__).parent
@@ -18,17 +26,46 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL', '50')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL', '10')),
+    serverSelectionTimeoutMS=3000,
+    connectTimeoutMS=3000,
+    retryWrites=True
+)
 db = client[os.environ['DB_NAME']]
 
 # JWT Config
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default_secret_key')
 JWT_ALGORITHM = "HS256"
 
+# bcrypt cost factor; each +1 doubles hashing time
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+
+# Authenticated users keyed by a short hash of their token, stored as
+# (user, exp, user Mongo _id, cached_at). An entry lives for AUTH_CACHE_TTL
+# seconds or until the token expires, whichever comes first.
+AUTH_CACHE_TTL = 60
+auth_cache = TLRUCache(
+    maxsize=100_000,
+    ttu=lambda _key, value, now: min(now + AUTH_CACHE_TTL, value[1]),
+    timer=time.time,
+)
+# User Mongo _id -> when their document last changed. Cached entries from before
+# that are ignored, so role changes and deletions apply on the next request.
+# Fed by watch_user_changes().
+user_revoked_at: Dict[object, float] = {}
+
 # Stripe Config
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
 
-app = FastAPI()
+@lru_cache(maxsize=8)
+def get_stripe_client(webhook_url: str) -> StripeCheckout:
+    # One client per webhook URL (normally just one) so its HTTP connections are reused
+    return StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Configure logging
@@ -97,6 +134,16 @@ class ProductResponse(BaseModel):
     featured: bool
     created_at: str
 
+class ProductListItem(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    name: str
+    price: float
+    category: str
+    images: List[str]
+    brand: str
+    featured: bool
+
 class CartItem(BaseModel):
     product_id: str
     quantity: int
@@ -117,13 +164,27 @@ class OrderCreate(BaseModel):
 class CheckoutRequest(BaseModel):
     origin_url: str
 
+# ==================== HELPERS ====================
+
+def new_id() -> str:
+    # 32 hex chars: same uniqueness as str(uuid4()) without the hyphens
+    return uuid.uuid4().hex
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
 # ==================== AUTH HELPERS ====================
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+# bcrypt is CPU-bound, so hashing runs in a worker thread to keep the event loop free
+async def hash_password(password: str) -> str:
+    hashed = await asyncio.to_thread(bcrypt.hashpw, password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode()
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await asyncio.to_thread(bcrypt.checkpw, password.encode(), hashed.encode())
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+# Checked against on logins for unknown emails, at the same cost as a real hash
+DUMMY_PASSWORD_HASH = bcrypt.hashpw(uuid.uuid4().bytes, bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 def create_token(user_id: str, email: str, role: str) -> str:
     payload = {
@@ -134,15 +195,46 @@ def create_token(user_id: str, email: str, role: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def token_cache_key(token: str) -> bytes:
+    # 8-byte blake2b digest: far smaller than the token itself and cheaper than SHA-256
+    return hashlib.blake2b(token.encode(), digest_size=8, usedforsecurity=False).digest()
+
+def revoke_cached_user(mongo_id):
+    now = time.time()
+    user_revoked_at[mongo_id] = now
+    # Anything cached before now - AUTH_CACHE_TTL has already expired, so older marks can go
+    for revoked_id, revoked_at in list(user_revoked_at.items()):
+        if revoked_at < now - AUTH_CACHE_TTL:
+            del user_revoked_at[revoked_id]
+
+async def watch_user_changes():
+    """Revoke cached sessions whenever a user document is updated, replaced or deleted"""
+    pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+    try:
+        async with db.users.watch(pipeline) as stream:
+            async for change in stream:
+                revoke_cached_user(change["documentKey"]["_id"])
+    except PyMongoError as e:
+        # Change streams need a replica set; without one, cached sessions just age out
+        logger.warning(f"User change stream unavailable, auth cache relies on its {AUTH_CACHE_TTL}s TTL: {e}")
+
 async def get_current_user(authorization: Optional[str] = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
     token = authorization.split(" ")[1]
+    key = token_cache_key(token)
+    cached = auth_cache.get(key)
+    if cached and user_revoked_at.get(cached[2], 0) < cached[3]:
+        return cached[0]
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
+        # Taken before the read so a change landing mid-read still revokes this entry
+        cached_at = time.time()
+        user = await db.users.find_one({"id": payload["user_id"]})
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
+        mongo_id = user.pop("_id")
+        auth_cache[key] = (user, payload["exp"], mongo_id, cached_at)
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -162,16 +254,20 @@ async def register(user_data: UserCreate):
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    user_id = str(uuid.uuid4())
+    user_id = new_id()
     user = {
         "id": user_id,
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await hash_password(user_data.password),
         "name": user_data.name,
         "role": "user",
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": now_iso()
     }
-    await db.users.insert_one(user)
+    try:
+        await db.users.insert_one(user)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     token = create_token(user_id, user_data.email, "user")
     user_response = UserResponse(
@@ -183,7 +279,9 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user["password"]):
+    # Always pay for one bcrypt check so timing doesn't reveal whether the email exists
+    password_ok = await verify_password(credentials.password, user["password"] if user else DUMMY_PASSWORD_HASH)
+    if not user or not password_ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(user["id"], user["email"], user.get("role", "user"))
@@ -202,44 +300,83 @@ async def get_me(user: dict = Depends(get_current_user)):
 
 # ==================== PRODUCT ROUTES ====================
 
-@api_router.get("/products", response_model=List[ProductResponse])
-async def get_products(category: Optional[str] = None, featured: Optional[bool] = None):
+# Fields needed to render a product card; ?slim=true returns only these
+PRODUCT_LIST_PROJECTION = {"_id": 0, **{field: 1 for field in ProductListItem.model_fields}}
+
+# The catalog is read far more often than it changes, so product reads are cached
+# briefly in-process and dropped on every admin write. Misses simply go to Mongo.
+PRODUCT_CACHE_TTL = 30
+products_cache = TTLCache(maxsize=1024, ttl=PRODUCT_CACHE_TTL)    # (category, featured, slim) -> list
+product_cache = TTLCache(maxsize=10_000, ttl=PRODUCT_CACHE_TTL)   # product_id -> product
+# Bumped on every invalidation; a read only stores its result if no write happened
+# while it was waiting on Mongo, so a pre-write result never lands in the cache
+product_cache_generation = 0
+
+def invalidate_product_caches(product_id: Optional[str] = None):
+    global product_cache_generation
+    product_cache_generation += 1
+    products_cache.clear()
+    if product_id is None:
+        product_cache.clear()
+    else:
+        product_cache.pop(product_id, None)
+
+# Product reads return Mongo's dicts directly: they were validated on the way in, so
+# re-validating through a response_model on every request is pure overhead.
+# The models are still listed under `responses` to keep the OpenAPI schema.
+@api_router.get("/products", responses={200: {"model": List[Union[ProductResponse, ProductListItem]]}})
+async def get_products(category: Optional[str] = None, featured: Optional[bool] = None, slim: bool = False):
     query = {}
     if category:
         query["category"] = category
     if featured is not None:
         query["featured"] = featured
-    products = await db.products.find(query, {"_id": 0}).to_list(100)
-    return products
-
-@api_router.get("/products/{product_id}", response_model=ProductResponse)
+    key = (category or "", featured, slim)
+    products = products_cache.get(key)
+    if products is None:
+        generation = product_cache_generation
+        projection = PRODUCT_LIST_PROJECTION if slim else {"_id": 0}
+        products = await db.products.find(query, projection).batch_size(100).to_list(100)
+        if generation == product_cache_generation:
+            products_cache[key] = products
+    return ORJSONResponse(content=products)
+
+@api_router.get("/products/{product_id}", responses={200: {"model": ProductResponse}})
 async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    product = product_cache.get(product_id)
+    if product is None:
+        generation = product_cache_generation
+        product = await db.products.find_one({"id": product_id}, {"_id": 0})
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        if generation == product_cache_generation:
+            product_cache[product_id] = product
+    return ORJSONResponse(content=product)
 
 @api_router.post("/admin/products", response_model=ProductResponse)
 async def create_product(product: ProductCreate, user: dict = Depends(get_admin_user)):
-    product_id = str(uuid.uuid4())
+    product_id = new_id()
     product_dict = {
         "id": product_id,
         **product.model_dump(),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": now_iso()
     }
     await db.products.insert_one(product_dict)
     product_dict.pop("_id", None)
+    invalidate_product_caches(product_id)
     return product_dict
 
 @api_router.put("/admin/products/{product_id}", response_model=ProductResponse)
 async def update_product(product_id: str, product: ProductUpdate, user: dict = Depends(get_admin_user)):
-    update_data = {k: v for k, v in product.model_dump().items() if v is not None}
+    # Only the fields the client sent; explicit nulls are still ignored since every stored field is required
+    update_data = product.model_dump(exclude_unset=True, exclude_none=True)
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
     result = await db.products.update_one({"id": product_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    invalidate_product_caches(product_id)
     
     updated = await db.products.find_one({"id": product_id}, {"_id": 0})
     return updated
@@ -249,74 +386,82 @@ async def delete_product(product_id: str, user: dict = Depends(get_admin_user)):
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    invalidate_product_caches(product_id)
     return {"message": "Product deleted"}
 
 # ==================== CART ROUTES ====================
 
 @api_router.get("/cart")
 async def get_cart(user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]}, {"_id": 0})
-    if not cart:
-        cart = {"id": str(uuid.uuid4()), "user_id": user["id"], "items": [], "updated_at": datetime.now(timezone.utc).isoformat()}
-        await db.carts.insert_one(cart)
-        cart.pop("_id", None)
+    # Fetch the cart, creating an empty one first if needed, in a single round-trip
+    cart = await db.carts.find_one_and_update(
+        {"user_id": user["id"]},
+        {"$setOnInsert": {"id": new_id(), "items": [], "updated_at": now_iso()}},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
     
-    # Populate product details
-    populated_items = []
-    for item in cart.get("items", []):
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
-        if product:
-            populated_items.append({**item, "product": product})
-    cart["items"] = populated_items
+    # Populate product details with a single query for all items
+    items = cart.get("items", [])
+    ids = [item["product_id"] for item in items]
+    products = await db.products.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids)) if ids else []
+    by_id = {p["id"]: p for p in products}
+    cart["items"] = [{**item, "product": by_id[item["product_id"]]} for item in items if item["product_id"] in by_id]
     return cart
 
 @api_router.post("/cart/add")
 async def add_to_cart(item: CartItem, user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]}, {"_id": 0})
-    if not cart:
-        cart = {"id": str(uuid.uuid4()), "user_id": user["id"], "items": [], "updated_at": datetime.now(timezone.utc).isoformat()}
-        await db.carts.insert_one(cart)
-    
-    items = cart.get("items", [])
-    existing_index = next((i for i, x in enumerate(items) if x["product_id"] == item.product_id and x["size"] == item.size and x["color"] == item.color), None)
-    
-    if existing_index is not None:
-        items[existing_index]["quantity"] += item.quantity
+    now = now_iso()
+    match = {"product_id": item.product_id, "size": item.size, "color": item.color}
+    for _ in range(3):
+        # Bump the quantity in place if this product/size/color is already in the cart
+        result = await db.carts.update_one(
+            {"user_id": user["id"], "items": {"$elemMatch": match}},
+            {"$inc": {"items.$.quantity": item.quantity}, "$set": {"updated_at": now}}
+        )
+        if result.matched_count:
+            break
+        # Otherwise append it, creating the cart if the user doesn't have one yet. The filter
+        # only matches while the line is still absent; if a concurrent add pushed it first, the
+        # upsert collides with the unique user_id index and we go back to bumping the quantity.
+        try:
+            await db.carts.update_one(
+                {"user_id": user["id"], "items": {"$not": {"$elemMatch": match}}},
+                {"$push": {"items": item.model_dump()}, "$set": {"updated_at": now}, "$setOnInsert": {"id": new_id()}},
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            continue
     else:
-        items.append(item.model_dump())
-    
-    await db.carts.update_one(
-        {"user_id": user["id"]},
-        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+        raise HTTPException(status_code=409, detail="Cart changed concurrently, please retry")
     return {"message": "Item added to cart"}
 
 @api_router.put("/cart/update")
 async def update_cart_item(item: CartItem, user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]}, {"_id": 0})
-    if not cart:
+    now = now_iso()
+    match = {"product_id": item.product_id, "size": item.size, "color": item.color}
+    if item.quantity <= 0:
+        result = await db.carts.update_one(
+            {"user_id": user["id"]},
+            {"$pull": {"items": match}, "$set": {"updated_at": now}}
+        )
+    else:
+        result = await db.carts.update_one(
+            {"user_id": user["id"]},
+            {"$set": {"items.$[e].quantity": item.quantity, "updated_at": now}},
+            array_filters=[{f"e.{k}": v for k, v in match.items()}]
+        )
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Cart not found")
-    
-    items = cart.get("items", [])
-    for i, x in enumerate(items):
-        if x["product_id"] == item.product_id and x["size"] == item.size and x["color"] == item.color:
-            if item.quantity <= 0:
-                items.pop(i)
-            else:
-                items[i]["quantity"] = item.quantity
-            break
-    
-    await db.carts.update_one(
-        {"user_id": user["id"]},
-        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
     return {"message": "Cart updated"}
 
 @api_router.delete("/cart/clear")
 async def clear_cart(user: dict = Depends(get_current_user)):
     await db.carts.update_one(
         {"user_id": user["id"]},
-        {"$set": {"items": [], "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"items": [], "updated_at": now_iso()}}
     )
     return {"message": "Cart cleared"}
 
@@ -324,16 +469,20 @@ async def clear_cart(user: dict = Depends(get_current_user)):
 
 @api_router.post("/checkout/create-session")
 async def create_checkout_session(request: CheckoutRequest, http_request: Request, user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": user["id"]}, {"_id": 0})
-    if not cart or not cart.get("items"):
+    # Calculate total from server-side prices in a single aggregation; items whose
+    # product no longer exists are dropped by the $unwind after the $lookup
+    pipeline = [
+        {"$match": {"user_id": user["id"]}},
+        {"$unwind": "$items"},
+        {"$lookup": {"from": "products", "localField": "items.product_id", "foreignField": "id", "as": "product"}},
+        {"$unwind": "$product"},
+        {"$group": {"_id": "$id", "total": {"$sum": {"$multiply": ["$items.quantity", "$product.price"]}}}}
+    ]
+    result = await db.carts.aggregate(pipeline).to_list(1)
+    if not result:
         raise HTTPException(status_code=400, detail="Cart is empty")
-    
-    # Calculate total from server-side data
-    total = 0.0
-    for item in cart["items"]:
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
-        if product:
-            total += product["price"] * item["quantity"]
+    cart_id = result[0]["_id"]
+    total = result[0]["total"]
     
     if total <= 0:
         raise HTTPException(status_code=400, detail="Invalid cart total")
@@ -345,65 +494,81 @@ async def create_checkout_session(request: CheckoutRequest, http_request: Reques
     host_url = str(http_request.base_url).rstrip('/')
     webhook_url = f"{host_url}/api/webhook/stripe"
     
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = get_stripe_client(webhook_url)
     
     checkout_request = CheckoutSessionRequest(
         amount=float(total),
         currency="usd",
         success_url=success_url,
         cancel_url=cancel_url,
-        metadata={"user_id": user["id"], "cart_id": cart["id"]}
+        metadata={"user_id": user["id"], "cart_id": cart_id}
     )
     
     session = await stripe_checkout.create_checkout_session(checkout_request)
     
     # Create payment transaction record
     transaction = {
-        "id": str(uuid.uuid4()),
+        "id": new_id(),
         "session_id": session.session_id,
         "user_id": user["id"],
         "amount": total,
         "currency": "usd",
         "status": "pending",
         "payment_status": "initiated",
-        "metadata": {"cart_id": cart["id"]},
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "order_created": False,
+        "metadata": {"cart_id": cart_id},
+        "created_at": now_iso()
     }
     await db.payment_transactions.insert_one(transaction)
     
     return {"url": session.url, "session_id": session.session_id}
 
+async def fulfill_paid_session(session_id: str):
+    """Mark a paid checkout session complete and turn its cart into an order, exactly once.
+
+    Called by both the status poll and the Stripe webhook; whichever claims the
+    transaction first creates the order and the other finds nothing to claim.
+    """
+    now = now_iso()
+    transaction = await db.payment_transactions.find_one_and_update(
+        {"session_id": session_id, "$or": [
+            {"order_created": False},
+            # Transactions created before the flag existed: only claim them while still unpaid
+            {"order_created": {"$exists": False}, "payment_status": {"$ne": "paid"}}
+        ]},
+        {"$set": {"status": "complete", "payment_status": "paid", "order_created": True, "updated_at": now}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not transaction:
+        return
+    
+    user_id = transaction["user_id"]
+    cart = await db.carts.find_one({"user_id": user_id}, {"_id": 0})
+    if cart and cart.get("items"):
+        order = {
+            "id": new_id(),
+            "user_id": user_id,
+            "items": cart["items"],
+            "total": transaction["amount"],
+            "status": "confirmed",
+            "payment_session_id": session_id,
+            "created_at": now
+        }
+        await db.orders.insert_one(order)
+        await db.carts.update_one({"user_id": user_id}, {"$set": {"items": []}})
+
 @api_router.get("/checkout/status/{session_id}")
 async def get_checkout_status(session_id: str, http_request: Request, user: dict = Depends(get_current_user)):
     host_url = str(http_request.base_url).rstrip('/')
     webhook_url = f"{host_url}/api/webhook/stripe"
     
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = get_stripe_client(webhook_url)
     status = await stripe_checkout.get_checkout_status(session_id)
     
-    # Update transaction status
+    # Update transaction status and create the order
     if status.payment_status == "paid":
-        transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
-        if transaction and transaction.get("payment_status") != "paid":
-            await db.payment_transactions.update_one(
-                {"session_id": session_id},
-                {"$set": {"status": "complete", "payment_status": "paid", "updated_at": datetime.now(timezone.utc).isoformat()}}
-            )
-            
-            # Create order
-            cart = await db.carts.find_one({"user_id": user["id"]}, {"_id": 0})
-            if cart and cart.get("items"):
-                order = {
-                    "id": str(uuid.uuid4()),
-                    "user_id": user["id"],
-                    "items": cart["items"],
-                    "total": status.amount_total / 100,
-                    "status": "confirmed",
-                    "payment_session_id": session_id,
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.orders.insert_one(order)
-                await db.carts.update_one({"user_id": user["id"]}, {"$set": {"items": []}})
+        await fulfill_paid_session(session_id)
     
     return {
         "status": status.status,
@@ -420,14 +585,11 @@ async def stripe_webhook(request: Request):
     try:
         host_url = str(request.base_url).rstrip('/')
         webhook_url = f"{host_url}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+        stripe_checkout = get_stripe_client(webhook_url)
         webhook_response = await stripe_checkout.handle_webhook(body, signature)
         
         if webhook_response.payment_status == "paid":
-            await db.payment_transactions.update_one(
-                {"session_id": webhook_response.session_id},
-                {"$set": {"status": "complete", "payment_status": "paid", "updated_at": datetime.now(timezone.utc).isoformat()}}
-            )
+            await fulfill_paid_session(webhook_response.session_id)
         
         return {"received": True}
     except Exception as e:
@@ -450,13 +612,15 @@ async def get_all_orders(user: dict = Depends(get_admin_user)):
 
 @api_router.get("/admin/stats")
 async def get_admin_stats(user: dict = Depends(get_admin_user)):
-    total_products = await db.products.count_documents({})
-    total_orders = await db.orders.count_documents({})
-    total_users = await db.users.count_documents({})
-    
-    # Calculate total revenue
-    orders = await db.orders.find({}, {"_id": 0, "total": 1}).to_list(1000)
-    total_revenue = sum(order.get("total", 0) for order in orders)
+    # The four queries are independent, so overlap their round-trips.
+    # Revenue is summed server-side so only the total crosses the wire.
+    total_products, total_orders, total_users, revenue = await asyncio.gather(
+        db.products.count_documents({}),
+        db.orders.count_documents({}),
+        db.users.count_documents({}),
+        db.orders.aggregate([{"$group": {"_id": None, "total": {"$sum": "$total"}}}]).to_list(1)
+    )
+    total_revenue = revenue[0]["total"] if revenue else 0
     
     return {
         "total_products": total_products,
@@ -467,6 +631,106 @@ async def get_admin_stats(user: dict = Depends(get_admin_user)):
 
 # ==================== SEED DATA ====================
 
+# Static catalog fields; seed_data adds the per-run id and created_at
+SEED_PRODUCTS = (
+    {
+        "name": "Classic Oxford",
+        "description": "Timeless elegance meets unparalleled comfort. Handcrafted from premium Italian leather with Goodyear welt construction.",
+        "price": 485.00,
+        "category": "men",
+        "images": ["https://images.unsplash.com/photo-1614252369475-531eba835eb1?w=800", "https://images.unsplash.com/photo-1587521503498-24ac2bab8f72?w=800"],
+        "sizes": ["7", "8", "9", "10", "11", "12"],
+        "colors": ["Black", "Cognac", "Burgundy"],
+        "brand": "Maison Luxe",
+        "stock": 50,
+        "featured": True
+    },
+    {
+        "name": "Stiletto Elegance",
+        "description": "A masterpiece of design. These stunning heels feature genuine Nappa leather and a hand-polished finish.",
+        "price": 595.00,
+        "category": "women",
+        "images": ["https://images.unsplash.com/photo-1543163521-1bf539c55dd2?w=800", "https://images.unsplash.com/photo-1515347619252-60a4bf4fff4f?w=800"],
+        "sizes": ["5", "6", "7", "8", "9"],
+        "colors": ["Noir", "Crimson", "Nude"],
+        "brand": "Valentina",
+        "stock": 35,
+        "featured": True
+    },
+    {
+        "name": "Monaco Loafer",
+        "description": "Effortless sophistication. Slip-on luxury crafted from supple suede with leather-wrapped soles.",
+        "price": 425.00,
+        "category": "men",
+        "images": ["https://images.unsplash.com/photo-1626379953822-baec19c3accd?w=800", "https://images.unsplash.com/photo-1533867617858-e7b97e060509?w=800"],
+        "sizes": ["7", "8", "9", "10", "11", "12"],
+        "colors": ["Navy", "Tan", "Charcoal"],
+        "brand": "Maison Luxe",
+        "stock": 45,
+        "featured": True
+    },
+    {
+        "name": "Athena Sandal",
+        "description": "Goddess-worthy comfort. Braided leather straps meet a cushioned footbed for all-day elegance.",
+        "price": 345.00,
+        "category": "women",
+        "images": ["https://images.unsplash.com/photo-1603808033192-082d6919d3e1?w=800", "https://images.unsplash.com/photo-1562273138-f46be4ebdf33?w=800"],
+        "sizes": ["5", "6", "7", "8", "9"],
+        "colors": ["Gold", "Silver", "Bronze"],
+        "brand": "Valentina",
+        "stock": 40,
+        "featured": False
+    },
+    {
+        "name": "Junior Elite",
+        "description": "Premium quality for young explorers. Durable yet stylish footwear designed for active kids.",
+        "price": 185.00,
+        "category": "kids",
+        "images": ["https://images.unsplash.com/photo-1555274175-75f79b09d5b8?w=800", "https://images.unsplash.com/photo-1514989940723-e8e51d675571?w=800"],
+        "sizes": ["1", "2", "3", "4", "5"],
+        "colors": ["White", "Navy", "Red"],
+        "brand": "Piccolo",
+        "stock": 60,
+        "featured": False
+    },
+    {
+        "name": "Velocity Pro",
+        "description": "Engineered for excellence. Advanced cushioning technology meets aerodynamic design.",
+        "price": 275.00,
+        "category": "sports",
+        "images": ["https://images.unsplash.com/photo-1542291026-7eec264c27ff?w=800", "https://images.unsplash.com/photo-1608231387042-66d1773070a5?w=800"],
+        "sizes": ["7", "8", "9", "10", "11", "12"],
+        "colors": ["Black/Gold", "White/Silver", "Navy/Red"],
+        "brand": "Athletica",
+        "stock": 75,
+        "featured": True
+    },
+    {
+        "name": "Chelsea Boot",
+        "description": "The epitome of British craftsmanship. Full-grain leather with elastic side panels.",
+        "price": 545.00,
+        "category": "men",
+        "images": ["https://images.unsplash.com/photo-1638247025967-b4e38f787b76?w=800", "https://images.unsplash.com/photo-1605812860427-4024433a70fd?w=800"],
+        "sizes": ["7", "8", "9", "10", "11", "12"],
+        "colors": ["Black", "Brown", "Suede Tan"],
+        "brand": "Maison Luxe",
+        "stock": 30,
+        "featured": True
+    },
+    {
+        "name": "Ballet Flat",
+        "description": "Parisian chic at its finest. Quilted leather with signature bow detail.",
+        "price": 365.00,
+        "category": "women",
+        "images": ["https://images.unsplash.com/photo-1566150905458-1bf1fc113f0d?w=800", "https://images.unsplash.com/photo-1595950653106-6c9ebd614d3a?w=800"],
+        "sizes": ["5", "6", "7", "8", "9"],
+        "colors": ["Blush", "Black", "Cream"],
+        "brand": "Valentina",
+        "stock": 55,
+        "featured": False
+    }
+)
+
 @api_router.post("/seed")
 async def seed_data():
     # Check if products exist
@@ -475,133 +739,22 @@ async def seed_data():
         return {"message": "Data already seeded"}
     
     # Seed products
-    products = [
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Classic Oxford",
-            "description": "Timeless elegance meets unparalleled comfort. Handcrafted from premium Italian leather with Goodyear welt construction.",
-            "price": 485.00,
-            "category": "men",
-            "images": ["https://images.unsplash.com/photo-1614252369475-531eba835eb1?w=800", "https://images.unsplash.com/photo-1587521503498-24ac2bab8f72?w=800"],
-            "sizes": ["7", "8", "9", "10", "11", "12"],
-            "colors": ["Black", "Cognac", "Burgundy"],
-            "brand": "Maison Luxe",
-            "stock": 50,
-            "featured": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Stiletto Elegance",
-            "description": "A masterpiece of design. These stunning heels feature genuine Nappa leather and a hand-polished finish.",
-            "price": 595.00,
-            "category": "women",
-            "images": ["https://images.unsplash.com/photo-1543163521-1bf539c55dd2?w=800", "https://images.unsplash.com/photo-1515347619252-60a4bf4fff4f?w=800"],
-            "sizes": ["5", "6", "7", "8", "9"],
-            "colors": ["Noir", "Crimson", "Nude"],
-            "brand": "Valentina",
-            "stock": 35,
-            "featured": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Monaco Loafer",
-            "description": "Effortless sophistication. Slip-on luxury crafted from supple suede with leather-wrapped soles.",
-            "price": 425.00,
-            "category": "men",
-            "images": ["https://images.unsplash.com/photo-1626379953822-baec19c3accd?w=800", "https://images.unsplash.com/photo-1533867617858-e7b97e060509?w=800"],
-            "sizes": ["7", "8", "9", "10", "11", "12"],
-            "colors": ["Navy", "Tan", "Charcoal"],
-            "brand": "Maison Luxe",
-            "stock": 45,
-            "featured": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Athena Sandal",
-            "description": "Goddess-worthy comfort. Braided leather straps meet a cushioned footbed for all-day elegance.",
-            "price": 345.00,
-            "category": "women",
-            "images": ["https://images.unsplash.com/photo-1603808033192-082d6919d3e1?w=800", "https://images.unsplash.com/photo-1562273138-f46be4ebdf33?w=800"],
-            "sizes": ["5", "6", "7", "8", "9"],
-            "colors": ["Gold", "Silver", "Bronze"],
-            "brand": "Valentina",
-            "stock": 40,
-            "featured": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Junior Elite",
-            "description": "Premium quality for young explorers. Durable yet stylish footwear designed for active kids.",
-            "price": 185.00,
-            "category": "kids",
-            "images": ["https://images.unsplash.com/photo-1555274175-75f79b09d5b8?w=800", "https://images.unsplash.com/photo-1514989940723-e8e51d675571?w=800"],
-            "sizes": ["1", "2", "3", "4", "5"],
-            "colors": ["White", "Navy", "Red"],
-            "brand": "Piccolo",
-            "stock": 60,
-            "featured": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Velocity Pro",
-            "description": "Engineered for excellence. Advanced cushioning technology meets aerodynamic design.",
-            "price": 275.00,
-            "category": "sports",
-            "images": ["https://images.unsplash.com/photo-1542291026-7eec264c27ff?w=800", "https://images.unsplash.com/photo-1608231387042-66d1773070a5?w=800"],
-            "sizes": ["7", "8", "9", "10", "11", "12"],
-            "colors": ["Black/Gold", "White/Silver", "Navy/Red"],
-            "brand": "Athletica",
-            "stock": 75,
-            "featured": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Chelsea Boot",
-            "description": "The epitome of British craftsmanship. Full-grain leather with elastic side panels.",
-            "price": 545.00,
-            "category": "men",
-            "images": ["https://images.unsplash.com/photo-1638247025967-b4e38f787b76?w=800", "https://images.unsplash.com/photo-1605812860427-4024433a70fd?w=800"],
-            "sizes": ["7", "8", "9", "10", "11", "12"],
-            "colors": ["Black", "Brown", "Suede Tan"],
-            "brand": "Maison Luxe",
-            "stock": 30,
-            "featured": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "name": "Ballet Flat",
-            "description": "Parisian chic at its finest. Quilted leather with signature bow detail.",
-            "price": 365.00,
-            "category": "women",
-            "images": ["https://images.unsplash.com/photo-1566150905458-1bf1fc113f0d?w=800", "https://images.unsplash.com/photo-1595950653106-6c9ebd614d3a?w=800"],
-            "sizes": ["5", "6", "7", "8", "9"],
-            "colors": ["Blush", "Black", "Cream"],
-            "brand": "Valentina",
-            "stock": 55,
-            "featured": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-    ]
+    now = now_iso()
+    products = [{"id": new_id(), **p, "created_at": now} for p in SEED_PRODUCTS]
     
-    await db.products.insert_many(products)
+    await db.products.insert_many(products, ordered=False)
+    invalidate_product_caches()
     
     # Create admin user
     admin_exists = await db.users.find_one({"email": "admin@shoehaven.com"})
     if not admin_exists:
         admin = {
-            "id": str(uuid.uuid4()),
+            "id": new_id(),
             "email": "admin@shoehaven.com",
-            "password": hash_password("admin123"),
+            "password": await hash_password("admin123"),
             "name": "Admin",
             "role": "admin",
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": now
         }
         await db.users.insert_one(admin)
     
@@ -621,6 +774,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_db_pool():
+    # Connect before serving traffic so the first request doesn't pay for it;
+    # the pool then fills up to minPoolSize in the background
+    await db.command("ping")
+
+@app.on_event("startup")
+async def ensure_indexes():
+    # create_index is a no-op when the index already exists, so this is safe on every boot.
+    # A unique index fails to build if the collection already holds duplicates (e.g. carts
+    # created by racing requests before the index existed); log it and keep serving.
+    indexes = [
+        (db.users, "email", {"unique": True}),
+        (db.users, "id", {"unique": True}),
+        (db.products, "id", {"unique": True}),
+        (db.products, [("category", 1), ("featured", 1)], {}),
+        (db.carts, "user_id", {"unique": True}),
+        (db.orders, [("user_id", 1), ("created_at", -1)], {}),
+        (db.payment_transactions, "session_id", {"unique": True}),
+    ]
+    results = await asyncio.gather(
+        *(collection.create_index(keys, **options) for collection, keys, options in indexes),
+        return_exceptions=True
+    )
+    for (collection, keys, _options), result in zip(indexes, results):
+        if isinstance(result, Exception):
+            logger.error(f"Could not create index {keys} on {collection.name}: {result}")
+
+@app.on_event("startup")
+async def start_user_watcher():
+    app.state.user_watcher = asyncio.create_task(watch_user_changes())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.user_watcher.cancel()
     client.close()